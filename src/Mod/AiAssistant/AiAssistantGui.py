@@ -3,7 +3,15 @@ AI Assistant chat window GUI implementation
 """
 
 import os
+import html
+import math
 import json
+import asyncio
+import datetime
+import itertools
+import threading
+import traceback
+import collections
 import FreeCAD
 import FreeCADGui
 from PySide import QtCore, QtGui
@@ -26,29 +34,139 @@ except ImportError:
     )
     from PySide.QtCore import Qt, Signal, QSize
 
+# The OpenAI client is optional, the chat reports its absence when used
+try:
+    import openai
+    _OPENAI_AVAILABLE = True
+except ImportError:
+    _OPENAI_AVAILABLE = False
+
 
 # Global variable to store the chat window instance
 _chat_window_instance = None
 
+# Number of saved messages shown at once when loading a conversation
+_LOAD_BATCH_SIZE = 64
+
+# Converters for tool parameter types, anything else is passed as a string
+_TYPE_CONVERTERS = {"float": float, "int": int}
+
+# Default CAD tools: name, description, method name and parameters given
+# as (name, type, description)
+_DEFAULT_TOOLS = (
+    # Basic document operations
+    ("create_document", "Creates a new FreeCAD document", "_create_document", (
+        ("name", "string", "Name of the new document"),
+    )),
+    
+    # Basic geometry creation
+    ("create_box", "Creates a box with the specified dimensions", "_create_box", (
+        ("length", "float", "Length of the box"),
+        ("width", "float", "Width of the box"),
+        ("height", "float", "Height of the box"),
+    )),
+    ("create_cylinder", "Creates a cylinder with the specified dimensions", "_create_cylinder", (
+        ("radius", "float", "Radius of the cylinder"),
+        ("height", "float", "Height of the cylinder"),
+    )),
+    ("create_sphere", "Creates a sphere with the specified radius", "_create_sphere", (
+        ("radius", "float", "Radius of the sphere"),
+    )),
+    
+    # Transformation tools
+    ("move_object", "Moves an object by the specified vector", "_move_object", (
+        ("object_name", "string", "Name of the object to move"),
+        ("x", "float", "X component of displacement vector"),
+        ("y", "float", "Y component of displacement vector"),
+        ("z", "float", "Z component of displacement vector"),
+    )),
+    ("rotate_object", "Rotates an object by the specified angles (in degrees)", "_rotate_object", (
+        ("object_name", "string", "Name of the object to rotate"),
+        ("x_angle", "float", "Rotation angle around X axis (degrees)"),
+        ("y_angle", "float", "Rotation angle around Y axis (degrees)"),
+        ("z_angle", "float", "Rotation angle around Z axis (degrees)"),
+    )),
+    
+    # Boolean operations
+    ("boolean_union", "Performs a boolean union operation between two objects", "_boolean_union", (
+        ("object1_name", "string", "Name of the first object"),
+        ("object2_name", "string", "Name of the second object"),
+        ("result_name", "string", "Name of the resulting object"),
+    )),
+    ("boolean_cut", "Performs a boolean cut operation between two objects", "_boolean_cut", (
+        ("base_name", "string", "Name of the base object"),
+        ("tool_name", "string", "Name of the tool object to cut with"),
+        ("result_name", "string", "Name of the resulting object"),
+    )),
+    
+    # Query tools
+    ("list_objects", "Lists all objects in the active document", "_list_objects", ()),
+    ("get_object_info", "Gets information about a specific object", "_get_object_info", (
+        ("object_name", "string", "Name of the object"),
+    )),
+)
+
+# Default tools whose document recompute can be deferred
+_RECOMPUTE_TOOLS = frozenset((
+    "create_box", "create_cylinder", "create_sphere", "move_object",
+    "rotate_object", "boolean_union", "boolean_cut",
+))
+
+# FreeCAD value types that get_object_info shows by type name only
+_FREECAD_TYPES = frozenset(
+    getattr(FreeCAD, name) for name in ("Vector", "Placement", "Rotation", "Matrix")
+    if hasattr(FreeCAD, name)
+)
+
+# JSON schema types of tool parameter types, anything else is a string
+_JSON_TYPES = {"float": "number", "int": "integer"}
+
+# Templates used to describe tools to the LLM
+_PARAM_FMT = "%s (%s): %s"
+_TOOL_FMT = "Tool: %s\nDescription: %s%s"
+
+# Messages that left the history window are summarized in batches of this size
+_SUMMARY_THRESHOLD = 10
+_SUMMARY_PROMPT = (
+    "Summarize the following conversation between a user and a CAD assistant. "
+    "Keep the names and dimensions of every object that was created or changed."
+)
+
 
 class ToolRegistry:
     """Registry of available CAD tools that can be used by the AI assistant"""
     
     def __init__(self):
         self.tools = {}
+        self._tool_desc_cache = None
+        self._openai_tools_cache = None
         self.register_default_tools()
     
-    def register_tool(self, name, description, function, parameters=None):
-        """Register a new tool with the registry"""
+    def register_tool(self, name, description, function, parameters=None, recompute=False):
+        """Register a new tool with the registry
+        
+        Pass recompute=True if the function takes a recompute keyword that
+        allows the caller to recompute the document once after several tools.
+        """
         if parameters is None:
             parameters = []
         
+        self._add_tool(name, description, function, parameters, recompute)
+    
+    def _add_tool(self, name, description, function, parameters, recompute):
+        """Add a tool entry, with the converters of its parameters"""
         self.tools[name] = {
             "name": name,
             "description": description,
             "function": function,
-            "parameters": parameters
+            "parameters": parameters,
+            "converters": tuple(_TYPE_CONVERTERS.get(p["type"], str) for p in parameters),
+            "recompute": recompute
         }
+        
+        # Descriptions are rebuilt lazily on next request
+        self._tool_desc_cache = None
+        self._openai_tools_cache = None
     
     def get_tool(self, name):
         """Get a tool by name"""
@@ -60,126 +178,69 @@ class ToolRegistry:
     
     def get_tool_descriptions(self):
         """Get descriptions of all tools in a format suitable for an LLM"""
+        if self._tool_desc_cache is not None:
+            return self._tool_desc_cache
+        
         descriptions = []
         for name, tool in self.tools.items():
             param_desc = ""
             if tool["parameters"]:
-                params = []
-                for param in tool["parameters"]:
-                    params.append(f"{param['name']} ({param['type']}): {param['description']}")
-                param_desc = "\nParameters:\n" + "\n".join(params)
+                param_desc = "\nParameters:\n" + "\n".join(
+                    _PARAM_FMT % (param["name"], param["type"], param["description"])
+                    for param in tool["parameters"]
+                )
             
-            descriptions.append(f"Tool: {name}\nDescription: {tool['description']}{param_desc}")
+            descriptions.append(_TOOL_FMT % (name, tool["description"], param_desc))
         
-        return "\n\n".join(descriptions)
+        self._tool_desc_cache = "\n\n".join(descriptions)
+        return self._tool_desc_cache
+    
+    def get_openai_tools(self):
+        """Get all tools as function definitions for the OpenAI tools API"""
+        if self._openai_tools_cache is not None:
+            return self._openai_tools_cache
+        
+        self._openai_tools_cache = [
+            {
+                "type": "function",
+                "function": {
+                    "name": name,
+                    "description": tool["description"],
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            param["name"]: {
+                                "type": _JSON_TYPES.get(param["type"], "string"),
+                                "description": param["description"]
+                            }
+                            for param in tool["parameters"]
+                        },
+                        "required": [param["name"] for param in tool["parameters"]]
+                    }
+                }
+            }
+            for name, tool in self.tools.items()
+        ]
+        return self._openai_tools_cache
     
     def register_default_tools(self):
         """Register the default set of CAD tools"""
-        # Basic document operations
-        self.register_tool(
-            "create_document",
-            "Creates a new FreeCAD document",
-            self._create_document,
-            [{"name": "name", "type": "string", "description": "Name of the new document"}]
-        )
-        
-        # Basic geometry creation
-        self.register_tool(
-            "create_box",
-            "Creates a box with the specified dimensions",
-            self._create_box,
-            [
-                {"name": "length", "type": "float", "description": "Length of the box"},
-                {"name": "width", "type": "float", "description": "Width of the box"},
-                {"name": "height", "type": "float", "description": "Height of the box"}
-            ]
-        )
-        
-        self.register_tool(
-            "create_cylinder",
-            "Creates a cylinder with the specified dimensions",
-            self._create_cylinder,
-            [
-                {"name": "radius", "type": "float", "description": "Radius of the cylinder"},
-                {"name": "height", "type": "float", "description": "Height of the cylinder"}
-            ]
-        )
-        
-        self.register_tool(
-            "create_sphere",
-            "Creates a sphere with the specified radius",
-            self._create_sphere,
-            [{"name": "radius", "type": "float", "description": "Radius of the sphere"}]
-        )
-        
-        # Transformation tools
-        self.register_tool(
-            "move_object",
-            "Moves an object by the specified vector",
-            self._move_object,
-            [
-                {"name": "object_name", "type": "string", "description": "Name of the object to move"},
-                {"name": "x", "type": "float", "description": "X component of displacement vector"},
-                {"name": "y", "type": "float", "description": "Y component of displacement vector"},
-                {"name": "z", "type": "float", "description": "Z component of displacement vector"}
-            ]
-        )
-        
-        self.register_tool(
-            "rotate_object",
-            "Rotates an object by the specified angles (in degrees)",
-            self._rotate_object,
-            [
-                {"name": "object_name", "type": "string", "description": "Name of the object to rotate"},
-                {"name": "x_angle", "type": "float", "description": "Rotation angle around X axis (degrees)"},
-                {"name": "y_angle", "type": "float", "description": "Rotation angle around Y axis (degrees)"},
-                {"name": "z_angle", "type": "float", "description": "Rotation angle around Z axis (degrees)"}
-            ]
-        )
-        
-        # Boolean operations
-        self.register_tool(
-            "boolean_union",
-            "Performs a boolean union operation between two objects",
-            self._boolean_union,
-            [
-                {"name": "object1_name", "type": "string", "description": "Name of the first object"},
-                {"name": "object2_name", "type": "string", "description": "Name of the second object"},
-                {"name": "result_name", "type": "string", "description": "Name of the resulting object"}
-            ]
-        )
-        
-        self.register_tool(
-            "boolean_cut",
-            "Performs a boolean cut operation between two objects",
-            self._boolean_cut,
-            [
-                {"name": "base_name", "type": "string", "description": "Name of the base object"},
-                {"name": "tool_name", "type": "string", "description": "Name of the tool object to cut with"},
-                {"name": "result_name", "type": "string", "description": "Name of the resulting object"}
-            ]
-        )
-        
-        # Query tools
-        self.register_tool(
-            "list_objects",
-            "Lists all objects in the active document",
-            self._list_objects
-        )
-        
-        self.register_tool(
-            "get_object_info",
-            "Gets information about a specific object",
-            self._get_object_info,
-            [{"name": "object_name", "type": "string", "description": "Name of the object"}]
-        )
+        for name, description, function_name, parameters in _DEFAULT_TOOLS:
+            self._add_tool(
+                name, description, getattr(self, function_name),
+                [
+                    {"name": param[0], "type": param[1], "description": param[2]}
+                    for param in parameters
+                ],
+                name in _RECOMPUTE_TOOLS
+            )
     
     # Tool implementations
     def _create_document(self, name):
         doc = FreeCAD.newDocument(name)
         return f"Created new document: {name}"
     
-    def _create_box(self, length, width, height):
+    def _create_box(self, length, width, height, recompute=True):
         if not FreeCAD.ActiveDocument:
             return "No active document. Please create a document first."
         
@@ -188,10 +249,11 @@ class ToolRegistry:
         box.Length = length
         box.Width = width
         box.Height = height
-        doc.recompute()
+        if recompute:
+            doc.recompute()
         return f"Created box with dimensions {length}x{width}x{height}"
     
-    def _create_cylinder(self, radius, height):
+    def _create_cylinder(self, radius, height, recompute=True):
         if not FreeCAD.ActiveDocument:
             return "No active document. Please create a document first."
         
@@ -199,20 +261,22 @@ class ToolRegistry:
         cylinder = doc.addObject("Part::Cylinder", "Cylinder")
         cylinder.Radius = radius
         cylinder.Height = height
-        doc.recompute()
+        if recompute:
+            doc.recompute()
         return f"Created cylinder with radius {radius} and height {height}"
     
-    def _create_sphere(self, radius):
+    def _create_sphere(self, radius, recompute=True):
         if not FreeCAD.ActiveDocument:
             return "No active document. Please create a document first."
         
         doc = FreeCAD.ActiveDocument
         sphere = doc.addObject("Part::Sphere", "Sphere")
         sphere.Radius = radius
-        doc.recompute()
+        if recompute:
+            doc.recompute()
         return f"Created sphere with radius {radius}"
     
-    def _move_object(self, object_name, x, y, z):
+    def _move_object(self, object_name, x, y, z, recompute=True):
         if not FreeCAD.ActiveDocument:
             return "No active document. Please create a document first."
         
@@ -227,12 +291,13 @@ class ToolRegistry:
             placement.Base.y += y
             placement.Base.z += z
             obj.Placement = placement
-            doc.recompute()
+            if recompute:
+                doc.recompute()
             return f"Moved object '{object_name}' by vector ({x}, {y}, {z})"
         else:
             return f"Object '{object_name}' cannot be moved (no Placement property)"
     
-    def _rotate_object(self, object_name, x_angle, y_angle, z_angle):
+    def _rotate_object(self, object_name, x_angle, y_angle, z_angle, recompute=True):
         if not FreeCAD.ActiveDocument:
             return "No active document. Please create a document first."
         
@@ -242,25 +307,23 @@ class ToolRegistry:
             return f"Object '{object_name}' not found"
         
         if hasattr(obj, "Placement"):
-            import math
-            from FreeCAD import Rotation
-            
             # Create rotation
-            rotation = Rotation(math.radians(x_angle), 
-                               math.radians(y_angle), 
-                               math.radians(z_angle))
+            rotation = FreeCAD.Rotation(math.radians(x_angle), 
+                                        math.radians(y_angle), 
+                                        math.radians(z_angle))
             
             # Apply rotation to current placement
             placement = obj.Placement
             placement.Rotation = rotation.multiply(placement.Rotation)
             obj.Placement = placement
             
-            doc.recompute()
+            if recompute:
+                doc.recompute()
             return f"Rotated object '{object_name}' by angles ({x_angle}, {y_angle}, {z_angle}) degrees"
         else:
             return f"Object '{object_name}' cannot be rotated (no Placement property)"
     
-    def _boolean_union(self, object1_name, object2_name, result_name):
+    def _boolean_union(self, object1_name, object2_name, result_name, recompute=True):
         if not FreeCAD.ActiveDocument:
             return "No active document. Please create a document first."
         
@@ -277,11 +340,12 @@ class ToolRegistry:
         union = doc.addObject("Part::Fuse", result_name)
         union.Base = obj1
         union.Tool = obj2
-        doc.recompute()
+        if recompute:
+            doc.recompute()
         
         return f"Created boolean union '{result_name}' from '{object1_name}' and '{object2_name}'"
     
-    def _boolean_cut(self, base_name, tool_name, result_name):
+    def _boolean_cut(self, base_name, tool_name, result_name, recompute=True):
         if not FreeCAD.ActiveDocument:
             return "No active document. Please create a document first."
         
@@ -298,7 +362,8 @@ class ToolRegistry:
         cut = doc.addObject("Part::Cut", result_name)
         cut.Base = base
         cut.Tool = tool
-        doc.recompute()
+        if recompute:
+            doc.recompute()
         
         return f"Created boolean cut '{result_name}' by cutting '{tool_name}' from '{base_name}'"
     
@@ -328,49 +393,58 @@ class ToolRegistry:
         if not obj:
             return f"Object '{object_name}' not found"
         
-        info = [f"Object: {obj.Name}", f"Type: {obj.TypeId}"]
-        
-        # Add properties
-        props = []
-        for prop in obj.PropertiesList:
-            try:
-                value = getattr(obj, prop)
-                if hasattr(value, "__module__") and "FreeCAD" in value.__module__:
-                    # For FreeCAD specific types, just show type name
-                    props.append(f"{prop}: <{type(value).__name__}>")
-                else:
-                    # For simple types, show the value
-                    props.append(f"{prop}: {value}")
-            except:
-                props.append(f"{prop}: <error reading value>")
-        
-        info.append("Properties:")
-        info.extend(props)
+        info = [f"Object: {obj.Name}", f"Type: {obj.TypeId}", "Properties:"]
+        info.extend([self._format_property(obj, prop) for prop in obj.PropertiesList])
         
         return "\n".join(info)
+    
+    def _format_property(self, obj, prop):
+        try:
+            value = getattr(obj, prop)
+            if type(value) in _FREECAD_TYPES:
+                # For FreeCAD specific types, just show type name
+                return f"{prop}: <{type(value).__name__}>"
+            # For simple types, show the value
+            return f"{prop}: {value}"
+        except Exception:
+            return f"{prop}: <error reading value>"
 
 
 class LLMConnector:
     """Connector for Large Language Models"""
     
-    def __init__(self, model_name="gpt-3.5-turbo"):
+    def __init__(self, model_name="gpt-3.5-turbo", max_history=20):
         self.model_name = model_name
         self.api_key = None
         self.base_url = None
         self.tool_registry = ToolRegistry()
+        self.client = None
+        self._cached_api_key = None
         self.system_prompt = self._generate_system_prompt()
-        self.conversation_history = []
+        self.conversation_history = collections.deque(maxlen=max_history)
+        # Older messages are condensed into a summary sent with each request
+        self._summary = None
+        self._summary_buffer = []
+        self._summary_future = None
+        # Requests run as coroutines on an event loop in a background thread,
+        # one at a time so that their messages do not interleave
+        self._loop = None
+        self._request_lock = None
+        # Request payload: system prompt, summary and the conversation history
+        self._messages = None
+        self._messages_summary = None
+        self._rebuild_messages()
+        # Set when a tool left the document recompute to the caller
+        self._recompute_pending = False
     
     def _generate_system_prompt(self):
-        """Generate the system prompt with tool descriptions"""
-        tools_description = self.tool_registry.get_tool_descriptions()
+        """Generate the system prompt
         
-        return f"""You are an AI assistant for CAD design using FreeCAD. 
-You can help users create and modify 3D models by understanding their requirements and using the available CAD tools.
-
-You have access to the following tools that allow you to interact with FreeCAD:
-
-{tools_description}
+        The tools are not described here, their definitions are sent with
+        each request through the tools API.
+        """
+        return """You are an AI assistant for CAD design using FreeCAD. 
+You can help users create and modify 3D models by understanding their requirements and using the CAD tools available to you, which interact with FreeCAD.
 
 When a user asks you to perform an action, you should:
 1. Understand the user's intent
@@ -395,223 +469,355 @@ Always respond in a helpful, informative manner.
         """Set the model name to use"""
         self.model_name = model_name
         
-    def add_message(self, role, content):
-        """Add a message to the conversation history"""
-        self.conversation_history.append({"role": role, "content": content})
+    def add_message(self, role, content, **fields):
+        """Add a message to the conversation history
+        
+        Extra fields, e.g. tool_calls or tool_call_id, are stored in the message.
+        """
+        message = {"role": role, "content": content, **fields}
+        history = self.conversation_history
+        # A full deque drops its oldest message on append
+        evicted = history[0] if len(history) == history.maxlen else None
+        history.append(message)
+        self._messages.append(message)
+        
+        if evicted is not None:
+            # The window slid, the evicted message is kept for the summary.
+            # Tool results cannot be sent without the call they answer.
+            self._summary_buffer.append(evicted)
+            while history and history[0]["role"] == "tool":
+                self._summary_buffer.append(history.popleft())
+            self._rebuild_messages()
+            if len(self._summary_buffer) >= _SUMMARY_THRESHOLD:
+                self._start_summary()
     
-    def send_message(self, message, callback=None):
-        """Send a message to the LLM and get a response"""
-        # Add user message to history
-        self.add_message("user", message)
+    def load_history(self, messages):
+        """Append saved messages, given as (role, content) pairs, to the history
+        
+        May be called from any thread. The messages are added in the event loop
+        thread, where requests change the history too.
+        """
+        self._get_loop().call_soon_threadsafe(self._add_history, messages)
+    
+    def _add_history(self, messages):
+        for role, content in messages:
+            self.add_message(role, content)
+    
+    def _rebuild_messages(self):
+        """Rebuild the request payload from the summary and the history"""
+        summary = self._summary
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if summary:
+            messages.append({"role": "system", "content": "Summary of the earlier conversation:\n" + summary})
+        messages.extend(self.conversation_history)
+        self._messages = messages
+        self._messages_summary = summary
+    
+    def _start_summary(self):
+        """Summarize the buffered messages in the background"""
+        if self.client is None:
+            return
+        if self._summary_future is not None and not self._summary_future.done():
+            return
+        
+        messages = self._summary_buffer
+        self._summary_buffer = []
+        self._summary_future = asyncio.run_coroutine_threadsafe(
+            self._summarize(messages), self._get_loop()
+        )
+    
+    async def _summarize(self, messages):
+        """Fold messages that left the history window into the summary"""
+        transcript = "\n".join(
+            f"{message['role']}: {message['content'] or ''}" for message in messages
+        )
+        if self._summary:
+            transcript = f"Summary so far:\n{self._summary}\n\n{transcript}"
         
         try:
-            # Check for API key
-            if not self.api_key:
-                # Try to use environmental variable
-                import os
-                api_key = os.environ.get("OPENAI_API_KEY", "")
-                if api_key:
-                    self.api_key = api_key
-                else:
-                    return "API key for the AI service is not set. Please set it in the settings."
-            
-            # Import API client
-            try:
-                import openai
-                self.client = openai.OpenAI(api_key=self.api_key)
-            except ImportError:
-                return "OpenAI Python package is not installed. Please install it with: pip install openai"
-            
-            # Prepare messages
-            messages = [{"role": "system", "content": self.system_prompt}] + self.conversation_history
-            
-            # Send request to API
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model_name,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=500
+                messages=[
+                    {"role": "system", "content": _SUMMARY_PROMPT},
+                    {"role": "user", "content": transcript}
+                ],
+                temperature=0.3,
+                max_tokens=300
             )
+            # Picked up by the next send_message
+            self._summary = response.choices[0].message.content
+        except Exception as e:
+            FreeCAD.Console.PrintError(f"Error summarizing AI assistant conversation: {str(e)}\n")
+            # Keep the messages for the next attempt, ahead of newer ones
+            self._summary_buffer[:0] = messages
+    
+    def _get_loop(self):
+        """Get the event loop of the connector, starting it on first use"""
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=self._loop.run_forever)
+            thread.daemon = True
+            thread.start()
+        return self._loop
+    
+    def submit_message(self, message, callback=None):
+        """Send a message to the LLM without waiting for the response
+        
+        Returns a concurrent.futures.Future for the response. The callback and
+        the future's done callbacks run in the connector's event loop thread.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self.send_message_async(message, callback), self._get_loop()
+        )
+    
+    def send_message(self, message, callback=None):
+        """Send a message to the LLM and get a response
+        
+        If given, callback is called with the partial response text while the
+        reply is streamed.
+        """
+        return self.submit_message(message, callback).result()
+    
+    async def send_message_async(self, message, callback=None):
+        """Coroutine version of send_message, run in the connector's event loop"""
+        # Created here to bind it to the connector's event loop
+        if self._request_lock is None:
+            self._request_lock = asyncio.Lock()
+        
+        async with self._request_lock:
+            return await self._send_message(message, callback)
+    
+    async def _send_message(self, message, callback):
+        """Handle a request, the caller holds the request lock"""
+        try:
+            # Include a summary that was finished in the background since the last request
+            if self._messages_summary is not self._summary:
+                self._rebuild_messages()
             
-            # Extract response
-            reply = response.choices[0].message.content
+            # Add user message to history
+            self.add_message("user", message)
             
-            # Add assistant response to history
-            self.add_message("assistant", reply)
+            error = self._prepare_client()
+            if error:
+                return error
             
-            # Check for tool calls in the response
-            tool_calls = self._extract_tool_calls(reply)
+            # Stream the reply, tool calls are executed as soon as they are complete
+            try:
+                reply, tool_calls, tool_results = await self._stream_reply(callback, execute_tools=True)
+            finally:
+                # The tools deferred their recomputes to a single one here,
+                # which is also needed if the stream broke off after some ran
+                self._flush_recompute()
             
             if tool_calls:
-                # Execute tool calls and get results
-                tool_results = []
-                for call in tool_calls:
-                    result = self._execute_tool_call(call)
-                    tool_results.append(result)
-                
-                # Add function calling results to the conversation
-                self.add_message("function", "\n".join(tool_results))
+                # Add the tool calls and their results to the conversation
+                self.add_message("assistant", reply or None, tool_calls=tool_calls)
+                for call, result in zip(tool_calls, tool_results):
+                    self.add_message("tool", result, tool_call_id=call["id"])
                 
                 # Get a follow-up response that incorporates the tool results
-                followup_response = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=messages + [
-                        {"role": "assistant", "content": reply},
-                        {"role": "function", "content": "\n".join(tool_results)}
-                    ],
-                    temperature=0.7,
-                    max_tokens=500
-                )
-                
-                # Extract and return the followup response
-                followup_reply = followup_response.choices[0].message.content
+                prefix = reply + "\n\n" if reply else ""
+                prefix += "\n".join(tool_results) + "\n\n"
+                followup_reply, _, _ = await self._stream_reply(callback, prefix)
                 self.add_message("assistant", followup_reply)
                 
-                return reply + "\n\n" + "\n".join(tool_results) + "\n\n" + followup_reply
+                result = prefix + followup_reply
+            else:
+                # Add assistant response to history
+                self.add_message("assistant", reply)
+                result = reply
             
-            return reply
+            return result
             
         except Exception as e:
-            import traceback
             error_message = f"Error communicating with AI service: {str(e)}\n{traceback.format_exc()}"
             FreeCAD.Console.PrintError(error_message + "\n")
             return f"Error: {str(e)}"
     
-    def _extract_tool_calls(self, text):
-        """Extract tool calls from the response text"""
-        tool_calls = []
-        
-        # Look for patterns like "use_tool(param1, param2)"
-        import re
-        pattern = r'(\w+)\(([^)]*)\)'
-        matches = re.findall(pattern, text)
+    def _prepare_client(self):
+        """Create the API client if needed, return an error message on failure"""
+        # Check for API key
+        if not self.api_key:
+            # Try to use environmental variable
+            api_key = os.environ.get("OPENAI_API_KEY", "")
+            if api_key:
+                self.api_key = api_key
+            else:
+                return "API key for the AI service is not set. Please set it in the settings."
+        
+        if not _OPENAI_AVAILABLE:
+            return "OpenAI Python package is not installed. Please install it with: pip install openai"
+        
+        # Reuse the client, and with it its connection pool, until the key changes
+        if self.client is None or self._cached_api_key != self.api_key:
+            self.client = openai.AsyncOpenAI(api_key=self.api_key)
+            self._cached_api_key = self.api_key
+        
+        return None
+    
+    async def _stream_reply(self, callback=None, prefix="", execute_tools=False):
+        """Stream a completion for the current messages
+        
+        The callback receives the prefix followed by the reply text received so
+        far after every chunk. With execute_tools the LLM may call tools, each
+        call is executed as soon as it has been received completely. Returns
+        the reply text, the tool calls and their results.
+        """
+        response = await self.client.chat.completions.create(
+            model=self.model_name,
+            messages=self._messages,
+            tools=self.tool_registry.get_openai_tools(),
+            tool_choice="auto" if execute_tools else "none",
+            temperature=0.7,
+            max_tokens=500,
+            stream=True
+        )
         
-        for match in matches:
-            tool_name = match[0]
-            params_str = match[1]
+        reply = ""
+        tool_calls = []
+        tool_results = []
+        async for chunk in response:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
             
-            # Check if the tool exists
-            tool = self.tool_registry.get_tool(tool_name)
-            if tool:
-                # Parse parameters
-                params = []
-                if params_str.strip():
-                    # Split by comma, but handle quotes correctly
-                    import shlex
-                    try:
-                        params = [param.strip().strip('\'"') for param in shlex.split(params_str, posix=False, comments=False)]
-                    except:
-                        # Fallback to simpler splitting if shlex fails
-                        params = [param.strip().strip('\'"') for param in params_str.split(',')]
+            # Tool calls arrive in fragments, a call is complete when the next
+            # starts. Without execute_tools no tools were offered, a backend
+            # that calls them anyway is ignored.
+            for call_delta in (delta.tool_calls if execute_tools else None) or ():
+                while call_delta.index >= len(tool_calls):
+                    if tool_calls:
+                        tool_results.append(self._execute_tool_call(tool_calls[-1], defer_recompute=True))
+                    tool_calls.append({"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
                 
-                tool_calls.append({
-                    "name": tool_name,
-                    "parameters": params
-                })
+                call = tool_calls[call_delta.index]
+                if call_delta.id:
+                    call["id"] = call_delta.id
+                if call_delta.function:
+                    if call_delta.function.name:
+                        call["function"]["name"] += call_delta.function.name
+                    if call_delta.function.arguments:
+                        call["function"]["arguments"] += call_delta.function.arguments
+            
+            if delta.content:
+                reply += delta.content
+                if callback:
+                    callback(prefix + reply)
         
-        return tool_calls
+        if len(tool_results) < len(tool_calls):
+            tool_results.append(self._execute_tool_call(tool_calls[-1], defer_recompute=True))
+        
+        return reply, tool_calls, tool_results
+    
+    def _flush_recompute(self):
+        """Recompute the document once for the tools that deferred it"""
+        if self._recompute_pending:
+            self._recompute_pending = False
+            if FreeCAD.ActiveDocument:
+                FreeCAD.ActiveDocument.recompute()
     
-    def _execute_tool_call(self, call):
-        """Execute a tool call and return the result"""
-        tool_name = call["name"]
-        params = call["parameters"]
+    def _execute_tool_call(self, call, defer_recompute=False):
+        """Execute a tool call and return the result
+        
+        With defer_recompute, tools that support it leave the document
+        recompute to the caller.
+        """
+        tool_name = call["function"]["name"]
         
         tool = self.tool_registry.get_tool(tool_name)
         if not tool:
             return f"Error: Tool '{tool_name}' not found"
         
         try:
-            # Convert parameters to the right types
-            converted_params = []
-            expected_params = tool.get("parameters", [])
-            
-            # If there are more parameters than expected, ignore extras
-            for i, param in enumerate(params):
-                if i >= len(expected_params):
-                    break
-                
-                param_type = expected_params[i]["type"]
-                if param_type == "float":
-                    converted_params.append(float(param))
-                elif param_type == "int":
-                    converted_params.append(int(param))
-                else:
-                    converted_params.append(param)
+            # Convert parameters to the right types, extras are ignored
+            arguments = json.loads(call["function"]["arguments"] or "{}")
+            converted_params = {
+                param["name"]: convert(arguments[param["name"]])
+                for param, convert in zip(tool["parameters"], tool["converters"])
+                if param["name"] in arguments
+            }
             
             # Execute the function
-            result = tool["function"](*converted_params)
+            if not defer_recompute:
+                result = tool["function"](**converted_params)
+            elif tool["recompute"]:
+                self._recompute_pending = True
+                result = tool["function"](**converted_params, recompute=False)
+            else:
+                # Other tools, e.g. queries, need the deferred changes applied
+                self._flush_recompute()
+                result = tool["function"](**converted_params)
             return f"Tool '{tool_name}' executed: {result}"
             
         except Exception as e:
-            import traceback
             error_message = f"Error executing tool '{tool_name}': {str(e)}\n{traceback.format_exc()}"
             FreeCAD.Console.PrintError(error_message + "\n")
             return f"Error executing tool '{tool_name}': {str(e)}"
 
 
-class ChatMessageWidget(QWidget):
-    """Widget for displaying a single chat message"""
+def _message_format(background):
+    """Paragraph format of a chat message"""
+    block_format = QtGui.QTextBlockFormat()
+    block_format.setBackground(QtGui.QColor(background))
+    block_format.setTopMargin(5)
+    block_format.setBottomMargin(5)
+    return block_format
+
+
+# Each chat message is one paragraph with a background per sender
+_USER_FORMAT = _message_format("#E9F5FE")
+_AI_FORMAT = _message_format("#F0F0F0")
+
+
+class _ReplySignals(QtCore.QObject):
+    """Signals that deliver LLM replies to the GUI thread"""
     
-    def __init__(self, text, sender_type="user", parent=None):
-        super(ChatMessageWidget, self).__init__(parent)
-        self.text = text
-        self.sender_type = sender_type
-        self.setup_ui()
+    partial = Signal(str, object)
+    finished = Signal(str, object)
+
+
+class _ConversationSignals(QtCore.QObject):
+    """Signals that deliver saved conversation messages to the GUI thread"""
     
-    def setup_ui(self):
-        layout = QVBoxLayout(self)
-        layout.setContentsMargins(5, 5, 5, 5)
-        
-        # Message frame
-        frame = QFrame(self)
-        frame.setFrameShape(QFrame.StyledPanel)
-        frame.setFrameShadow(QFrame.Raised)
-        
-        # Color based on sender type
-        if self.sender_type == "user":
-            frame.setStyleSheet("background-color: #E9F5FE; border-radius: 5px;")
-        else:
-            frame.setStyleSheet("background-color: #F0F0F0; border-radius: 5px;")
-        
-        # Message layout
-        msg_layout = QVBoxLayout(frame)
-        
-        # Header with icon and sender name
-        header_layout = QHBoxLayout()
-        
-        icon_label = QLabel()
-        if self.sender_type == "user":
-            icon_label.setText("User:")
-            icon_label.setStyleSheet("font-weight: bold; color: #2979FF;")
-        else:
-            icon_label.setText("AI Assistant:")
-            icon_label.setStyleSheet("font-weight: bold; color: #43A047;")
-        
-        header_layout.addWidget(icon_label)
-        header_layout.addStretch(1)
-        
-        # Add timestamp
-        import datetime
-        timestamp = QLabel(datetime.datetime.now().strftime("%H:%M"))
-        timestamp.setStyleSheet("color: #757575; font-size: 9pt;")
-        header_layout.addWidget(timestamp)
-        
-        msg_layout.addLayout(header_layout)
-        
-        # Message text
-        text_label = QLabel(self.text)
-        text_label.setWordWrap(True)
-        text_label.setTextInteractionFlags(Qt.TextSelectableByMouse | Qt.TextSelectableByKeyboard)
-        text_label.setOpenExternalLinks(True)
-        
-        msg_layout.addWidget(text_label)
-        
-        layout.addWidget(frame)
+    loaded = Signal(object)
+    finished = Signal()
+
+
+class _ConversationLoader(QtCore.QRunnable):
+    """Reads the messages of a saved conversation on a thread pool thread"""
+    
+    def __init__(self, messages, signals):
+        super(_ConversationLoader, self).__init__()
+        self.messages = messages
+        self.signals = signals
+    
+    def run(self):
+        try:
+            while True:
+                batch = list(itertools.islice(self.messages, _LOAD_BATCH_SIZE))
+                if not batch:
+                    break
+                self.signals.loaded.emit(batch)
+        except Exception as e:
+            FreeCAD.Console.PrintError(f"Error loading AI Assistant conversation: {str(e)}\n")
+        finally:
+            self.signals.finished.emit()
 
 
 class ChatWindow(QDockWidget):
     """The main chat window widget that integrates with FreeCAD"""
     
+    # Style sheet of the chat document, parsed once instead of per message
+    _CHAT_CSS = (
+        "b.user { color: #2979FF; }"
+        "b.assistant { color: #43A047; }"
+        "span.time { color: #757575; font-size: 9pt; }"
+    )
+    
+    # HTML templates for the contents of a single chat message
+    _USER_TMPL = '<b class="user">User:</b> <span class="time">{time}</span><br>{text}'
+    _AI_TMPL = '<b class="assistant">AI Assistant:</b> <span class="time">{time}</span><br>{text}'
+    
     def __init__(self, parent=None):
         super(ChatWindow, self).__init__(parent)
         
@@ -622,6 +828,23 @@ class ChatWindow(QDockWidget):
         # Create the LLM connector
         self.llm_connector = LLMConnector()
         
+        # LLM requests run in the connector's event loop thread, replies come
+        # back to the GUI thread through queued signals
+        self._reply_signals = _ReplySignals(self)
+        self._reply_signals.partial.connect(self._on_partial_reply)
+        self._reply_signals.finished.connect(self._on_reply)
+        self._conversation_signals = _ConversationSignals(self)
+        self._conversation_signals.loaded.connect(self._on_conversation_batch)
+        self._conversation_signals.finished.connect(self._on_conversation_loaded)
+        # Number of conversations being loaded, sending waits until they are
+        # in the history so that they come before the next message
+        self._loading = 0
+        
+        # Streamed chunks and scroll requests are coalesced until the event
+        # loop is idle so that bursts of updates cause a single relayout
+        self._pending_partials = {}
+        self._scroll_pending = False
+        
         # Set up the UI
         self.setup_ui()
         
@@ -672,20 +895,14 @@ How can I help you today?"""
         
         main_layout.addWidget(settings_frame)
         
-        # Chat messages area
-        self.chat_scroll = QScrollArea()
-        self.chat_scroll.setWidgetResizable(True)
-        self.chat_scroll.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-        self.chat_scroll.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
+        # Chat messages area, all messages share a single rich text document
+        self.chat_view = QTextEdit()
+        self.chat_view.setReadOnly(True)
+        self.chat_view.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.chat_view.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
+        self.chat_view.document().setDefaultStyleSheet(self._CHAT_CSS)
         
-        self.chat_container = QWidget()
-        self.chat_layout = QVBoxLayout(self.chat_container)
-        self.chat_layout.setAlignment(Qt.AlignTop)
-        self.chat_layout.setContentsMargins(0, 0, 0, 0)
-        self.chat_layout.setSpacing(10)
-        
-        self.chat_scroll.setWidget(self.chat_container)
-        main_layout.addWidget(self.chat_scroll, 1)
+        main_layout.addWidget(self.chat_view, 1)
         
         # Input area
         input_layout = QHBoxLayout()
@@ -695,11 +912,11 @@ How can I help you today?"""
         self.message_input.setAcceptRichText(False)
         self.message_input.setMaximumHeight(80)
         
-        send_button = QPushButton("Send")
-        send_button.clicked.connect(self.on_send_message)
+        self.send_button = QPushButton("Send")
+        self.send_button.clicked.connect(self.on_send_message)
         
         input_layout.addWidget(self.message_input)
-        input_layout.addWidget(send_button)
+        input_layout.addWidget(self.send_button)
         
         main_layout.addLayout(input_layout)
         
@@ -713,8 +930,6 @@ How can I help you today?"""
     
     def on_set_api_key(self):
         """Handle API key button click"""
-        from PySide import QtGui
-        
         api_key, ok = QtGui.QInputDialog.getText(
             self, "API Key", "Enter your API key:",
             QtGui.QLineEdit.Password
@@ -729,7 +944,7 @@ How can I help you today?"""
     def on_send_message(self):
         """Handle send button click"""
         message = self.message_input.toPlainText().strip()
-        if not message:
+        if not message or self._loading:
             return
         
         # Clear input
@@ -739,72 +954,140 @@ How can I help you today?"""
         self.add_message(message, "user")
         
         # Show thinking indicator
-        thinking_widget = ChatMessageWidget("Thinking...", "assistant")
-        self.chat_layout.addWidget(thinking_widget)
-        self.scroll_to_bottom()
+        thinking = self.add_message("Thinking...", "assistant")
         
-        # Process with LLM in a separate thread to avoid blocking the UI
-        def process_message():
-            response = self.llm_connector.send_message(message)
-            
-            # Update UI in the main thread
-            def update_ui():
-                # Remove thinking indicator
-                thinking_widget.setParent(None)
-                thinking_widget.deleteLater()
-                
-                # Add response
-                self.add_message(response, "assistant")
-            
-            from PySide import QtCore
-            QtCore.QMetaObject.invokeMethod(self, "update_ui", QtCore.Qt.QueuedConnection)
+        # Process with LLM in the background to avoid blocking the UI
+        signals = self._reply_signals
+        future = self.llm_connector.submit_message(
+            message, lambda text: signals.partial.emit(text, thinking)
+        )
+        future.add_done_callback(lambda future: signals.finished.emit(self._reply_text(future), thinking))
+    
+    @staticmethod
+    def _reply_text(future):
+        """Get the reply of a finished request, or an error message if it failed"""
+        if future.cancelled():
+            return "Error: The request was cancelled"
+        error = future.exception()
+        if error is not None:
+            FreeCAD.Console.PrintError(f"Error communicating with AI service: {str(error)}\n")
+            return f"Error: {str(error)}"
+        return future.result()
+    
+    @QtCore.Slot(str, object)
+    def _on_partial_reply(self, text, thinking):
+        """Show the reply streamed so far in place of the thinking indicator"""
+        if not self._pending_partials:
+            QtCore.QTimer.singleShot(0, self._flush_partial_replies)
+        self._pending_partials[id(thinking)] = (text, thinking)
+    
+    def _flush_partial_replies(self):
+        """Apply the latest streamed text of every reply in one update"""
+        pending = self._pending_partials
+        if not pending:
+            return
+        self._pending_partials = {}
         
-        # Run in a separate thread
-        import threading
-        thread = threading.Thread(target=process_message)
-        thread.daemon = True
-        thread.start()
+        self.chat_view.setUpdatesEnabled(False)
+        try:
+            for text, thinking in pending.values():
+                self.update_message(thinking, text, "assistant")
+        finally:
+            self.chat_view.setUpdatesEnabled(True)
+    
+    @QtCore.Slot(str, object)
+    def _on_reply(self, reply, thinking):
+        """Show the complete LLM reply in place of the thinking indicator"""
+        # Streamed text that is still pending is superseded by the reply
+        self._pending_partials.pop(id(thinking), None)
+        self.update_message(thinking, reply, "assistant")
+    
+    def load_conversation(self, messages):
+        """Show a saved conversation and add it to the LLM context
+        
+        messages may be a lazy iterator of message dicts, it is consumed on the
+        thread pool and shown in batches so that the window stays responsive.
+        """
+        self._loading += 1
+        self.send_button.setEnabled(False)
+        QtCore.QThreadPool.globalInstance().start(
+            _ConversationLoader(iter(messages), self._conversation_signals)
+        )
+    
+    @QtCore.Slot(object)
+    def _on_conversation_batch(self, messages):
+        """Show a batch of messages read by _ConversationLoader"""
+        history = []
+        self.chat_view.setUpdatesEnabled(False)
+        try:
+            for message in messages:
+                role = message.get("role")
+                content = message.get("content")
+                if role not in ("user", "assistant") or not isinstance(content, str):
+                    continue
+                history.append((role, content))
+                self.add_message(content, role)
+        finally:
+            self.chat_view.setUpdatesEnabled(True)
+        
+        self.llm_connector.load_history(history)
     
     @QtCore.Slot()
-    def update_ui(self):
-        """Update UI after message processing"""
-        pass  # Actual implementation in process_message
+    def _on_conversation_loaded(self):
+        """Allow sending again once no conversation is being loaded"""
+        self._loading -= 1
+        if not self._loading:
+            self.send_button.setEnabled(True)
+    
+    def _format_message(self, text, sender_type):
+        """Render the contents of a message as HTML"""
+        template = self._USER_TMPL if sender_type == "user" else self._AI_TMPL
+        return template.format(
+            time=datetime.datetime.now().strftime("%H:%M"),
+            text=html.escape(text).replace("\n", "<br>")
+        )
+    
+    def _fill_message(self, cursor, text, sender_type):
+        """Replace the selection of cursor with a message and select it"""
+        block_format = _USER_FORMAT if sender_type == "user" else _AI_FORMAT
+        start = cursor.selectionStart()
+        cursor.insertHtml(self._format_message(text, sender_type))
+        cursor.setBlockFormat(block_format)
+        cursor.setPosition(start)
+        cursor.movePosition(QTextCursor.EndOfBlock, QTextCursor.KeepAnchor)
     
     def add_message(self, text, sender_type):
-        """Add a message to the chat"""
-        # Create message widget
-        message_widget = ChatMessageWidget(text, sender_type)
-        self.chat_layout.addWidget(message_widget)
+        """Add a message to the chat and return a cursor selecting it"""
+        document = self.chat_view.document()
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.End)
+        if not document.isEmpty():
+            cursor.insertBlock()
+        
+        # The cursor follows later edits of the document but does not grow
+        # when further messages are appended after it
+        cursor.setKeepPositionOnInsert(True)
+        self._fill_message(cursor, text, sender_type)
         
         # Scroll to bottom
         self.scroll_to_bottom()
+        return cursor
     
-    def scroll_to_bottom(self):
-        """Scroll the chat to the bottom"""
-        scrollbar = self.chat_scroll.verticalScrollBar()
-        scrollbar.setValue(scrollbar.maximum())
-
-
-class OpenChatCommand:
-    """Command to open the AI Assistant chat window"""
-    
-    def GetResources(self):
-        return {
-            'Pixmap': os.path.join(os.path.dirname(__file__), "Resources", "icons", "AiAssistant.svg"),
-            'MenuText': "AI Assistant Chat",
-            'ToolTip': "Open the AI Assistant chat window"
-        }
+    def update_message(self, cursor, text, sender_type):
+        """Replace the text of a message previously returned by add_message"""
+        self._fill_message(cursor, text, sender_type)
+        self.scroll_to_bottom()
     
-    def Activated(self):
-        showChatWindow()
-        return
+    def scroll_to_bottom(self):
+        """Scroll the chat to the bottom once the event loop is idle"""
+        if not self._scroll_pending:
+            self._scroll_pending = True
+            QtCore.QTimer.singleShot(0, self._do_scroll)
     
-    def IsActive(self):
-        return True
-
-
-# Register the command
-FreeCADGui.addCommand("AiAssistant_OpenChat", OpenChatCommand())
+    def _do_scroll(self):
+        self._scroll_pending = False
+        scrollbar = self.chat_view.verticalScrollBar()
+        scrollbar.setValue(scrollbar.maximum())
 
 
 def showChatWindow():
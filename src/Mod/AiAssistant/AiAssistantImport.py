@@ -4,45 +4,167 @@ Import script for AI Assistant settings and conversations
 
 import os
 import json
+import mmap
+import functools
+import contextlib
 import FreeCAD
 
-def open(filename):
+# This module exports its own open() for FreeCAD's importer API
+from builtins import open as _open
+
+# orjson parses considerably faster than the json module, use it when available
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ijson parses incrementally, so large conversations need not be loaded at once
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+@contextlib.contextmanager
+def _map_file(filename):
+    """Map a file read-only so that parsers read its pages on demand"""
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    finally:
+        # The mapping keeps its own handle on the file
+        os.close(fd)
+    
+    try:
+        # Parsers only move forward, let the kernel read ahead of them
+        if hasattr(mmap, 'MADV_SEQUENTIAL'):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        yield mm
+    finally:
+        mm.close()
+
+
+@functools.lru_cache(maxsize=32)
+def _decode(path, mtime_ns, size):
+    """Parse a JSON file, cached until it is modified
+
+    mtime_ns and size are unused here, they only make a changed file miss the
+    cache. The result is shared between callers and must not be modified.
+    """
+    if orjson is None:
+        with _open(path, 'r') as f:
+            return json.load(f)
+    
+    with _map_file(path) as mm:
+        with memoryview(mm) as view:
+            return orjson.loads(view)
+
+
+def _load_json(filename):
+    """Parse a JSON file, reusing the result while the file is unchanged"""
+    path = os.path.realpath(filename)
+    st = os.stat(path)
+    return _decode(path, st.st_mtime_ns, st.st_size)
+
+
+def clear_cache():
+    """Forget all parsed files, e.g. before reloading them"""
+    _decode.cache_clear()
+
+
+@functools.cache
+def _gui():
+    """Import the GUI module on first use"""
+    import AiAssistantGui
+    return AiAssistantGui
+
+
+def _get_chat_window():
+    """Show the chat window, or return None when there is no GUI"""
+    if not FreeCAD.GuiUp:
+        return None
+    return _gui().showChatWindow()
+
+
+def _scan_section(filename):
+    """Find the top-level section of a file to load, in order of precedence
+
+    Parsing stops at the section that takes precedence over all others, only
+    files without it are read to the end in case it comes after another one.
+    """
+    sections = list(HANDLERS)
+    best = None
+    with _map_file(filename) as mm:
+        for prefix, event, value in ijson.parse(mm):
+            if prefix == '' and event == 'map_key' and value in HANDLERS:
+                if value == sections[0]:
+                    return value
+                if best is None or sections.index(value) < sections.index(best):
+                    best = value
+    return best
+
+
+def _iter_conversation(filename):
+    """Yield the messages of a conversation file one at a time"""
+    with _map_file(filename) as mm:
+        yield from ijson.items(mm, 'conversation.item')
+
+
+def _load_conversation(filename, data):
+    """Load a conversation into the chat window"""
+    FreeCAD.Console.PrintMessage(f"Loaded AI Assistant conversation from {filename}\n")
+    
+    chat_window = _get_chat_window()
+    if chat_window is not None:
+        # Messages are streamed into the chat window while it is shown
+        if data is None:
+            messages = _iter_conversation(filename)
+        else:
+            messages = data['conversation']
+        chat_window.load_conversation(messages)
+    
+    return True
+
+
+def _load_settings(filename, data):
+    """Apply settings to the chat window"""
+    FreeCAD.Console.PrintMessage(f"Loaded AI Assistant settings from {filename}\n")
+    
+    _get_chat_window()
+    # TODO: Implement settings loading in the chat window
+    
+    return True
+
+
+# Loaders for the top-level sections of AI Assistant files, in order of
+# precedence. They are passed the parsed file, or None when it is streamed.
+HANDLERS = {
+    'conversation': _load_conversation,
+    'settings': _load_settings,
+}
+
+
+def openDocument(filename):
     """Open an AI Assistant settings or conversation file"""
     
     try:
-        with open(filename, 'r') as f:
-            data = json.load(f)
-        
-        if 'conversation' in data:
-            # Load conversation data
-            FreeCAD.Console.PrintMessage(f"Loaded AI Assistant conversation from {filename}\n")
-            
-            # If GUI is available, open the chat window and load the conversation
-            if FreeCAD.GuiUp:
-                import AiAssistantGui
-                chat_window = AiAssistantGui.showChatWindow()
-                
-                # TODO: Implement conversation loading in the chat window
-                
-            return True
-            
-        elif 'settings' in data:
-            # Load settings data
-            FreeCAD.Console.PrintMessage(f"Loaded AI Assistant settings from {filename}\n")
-            
-            # If GUI is available, open the chat window and apply settings
-            if FreeCAD.GuiUp:
-                import AiAssistantGui
-                chat_window = AiAssistantGui.showChatWindow()
-                
-                # TODO: Implement settings loading in the chat window
-                
-            return True
-            
+        if ijson is not None:
+            data = None
+            section = _scan_section(filename)
         else:
+            data = _load_json(filename)
+            section = next((key for key in HANDLERS if key in data), None)
+        
+        if section is None:
             FreeCAD.Console.PrintError(f"Unknown AI Assistant file format in {filename}\n")
             return False
-            
+        
+        return HANDLERS[section](filename, data)
+        
     except Exception as e:
         FreeCAD.Console.PrintError(f"Error opening AI Assistant file {filename}: {str(e)}\n")
-        return False 
\ No newline at end of file
+        return False
+
+
+# FreeCAD's importer API looks the function up by this name
+open = openDocument
@@ -1,6 +1,7 @@
 """Initialize the AI Assistant workbench GUI"""
 
 import os
+import importlib.util
 import FreeCAD
 import FreeCADGui
 
@@ -35,26 +36,39 @@ static char * ai_assistant_icon_xpm[] = {
 "    ........    "};
 """
     
-    def __init__(self):
-        self.__class__.Icon = self.getIcon()
-    
-    def getIcon(self):
-        # Try to get a custom icon if available
-        try:
-            import os
-            icon_path = os.path.join(os.path.dirname(__file__), "Resources", "icons", "AiAssistant.svg")
-            if os.path.exists(icon_path):
-                return icon_path
-            return self.Icon
-        except:
-            return self.Icon
-    
     def Initialize(self):
         """Called when the workbench is first activated"""
-        import AiAssistantGui
+        
+        import os
+        import importlib.util
+        
+        # Locate the module without importing it, the chat GUI and LLM client
+        # are only loaded when the command is used
+        mod_path = os.path.dirname(importlib.util.find_spec("AiAssistantGui").origin)
+        
+        class OpenChatCommand:
+            """Command to open the AI Assistant chat window"""
+            
+            # Queried by FreeCAD on every menu update
+            Resources = {
+                'Pixmap': os.path.join(mod_path, "Resources", "icons", "AiAssistant.svg"),
+                'MenuText': "AI Assistant Chat",
+                'ToolTip': "Open the AI Assistant chat window"
+            }
+            
+            def GetResources(self):
+                return self.Resources
+            
+            def Activated(self):
+                import AiAssistantGui
+                AiAssistantGui.showChatWindow()
+            
+            def IsActive(self):
+                return True
         
         # Create commands
-        self.chat_command = AiAssistantGui.OpenChatCommand()
+        self.chat_command = OpenChatCommand()
+        FreeCADGui.addCommand("AiAssistant_OpenChat", self.chat_command)
         
         # Create menu and toolbar
         self.appendToolbar("AI Assistant", ["AiAssistant_OpenChat"])
@@ -64,7 +78,7 @@ static char * ai_assistant_icon_xpm[] = {
         """Called when the workbench is activated"""
         if FreeCAD.GuiUp:
             from PySide import QtCore
-            QtCore.QTimer.singleShot(500, self.showDockWindow)
+            QtCore.QTimer.singleShot(0, self.showDockWindow)
         return True
     
     def showDockWindow(self):
@@ -80,5 +94,17 @@ static char * ai_assistant_icon_xpm[] = {
         """Return the name of the class"""
         return "Gui::PythonWorkbench"
 
+# Resolve the icon once when the workbench is loaded instead of on every
+# instantiation. The XPM above is only used if the SVG is missing. __file__
+# is not defined under FreeCAD's exec-based loader, so the module directory
+# is found through a module of the workbench instead.
+_spec = importlib.util.find_spec("AiAssistantGui")
+if _spec is not None:
+    _icon_path = os.path.join(os.path.dirname(_spec.origin), "Resources", "icons", "AiAssistant.svg")
+    if os.path.exists(_icon_path):
+        AiAssistantWorkbench.Icon = _icon_path
+
 # Add the workbench to the list of workbenches
-FreeCADGui.addWorkbench(AiAssistantWorkbench()) 
\ No newline at end of file
+FreeCADGui.addWorkbench(AiAssistantWorkbench())
+
+FreeCAD.__unit_test__ += ["TestAiAssistantGui"]
@@ -0,0 +1,299 @@
+"""
+Unit tests for the LLM connector of the AI Assistant
+"""
+
+import asyncio
+import unittest
+from unittest import mock
+from types import SimpleNamespace
+
+import FreeCAD
+from AiAssistantGui import LLMConnector
+
+
+def _chunk(content=None, tool_calls=None):
+    """A streamed completion chunk as returned by openai.AsyncOpenAI"""
+    delta = SimpleNamespace(content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+def _call_delta(index, id=None, name=None, arguments=None):
+    """A fragment of a streamed tool call"""
+    function = SimpleNamespace(name=name, arguments=arguments)
+    return SimpleNamespace(index=index, id=id, function=function)
+
+
+class _FakeStream:
+    """Async iterator over chunks that records how many were consumed
+
+    If given, error is raised once all chunks were consumed.
+    """
+
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+        self.consumed = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.consumed == len(self.chunks):
+            raise self.error or StopAsyncIteration
+        self.consumed += 1
+        return self.chunks[self.consumed - 1]
+
+
+class _FakeClient:
+    """Stands in for openai.AsyncOpenAI, every request returns the same stream"""
+
+    def __init__(self, stream):
+        self.requests = []
+
+        async def create(**kwargs):
+            self.requests.append(kwargs)
+            return stream
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+
+
+class TestStreamReply(unittest.TestCase):
+    def setUp(self):
+        self.connector = LLMConnector()
+        self.executed = []
+        self.stream = None
+
+        def record(value):
+            # Remember how far the stream was read when the tool ran
+            self.executed.append((value, self.stream.consumed))
+            return f"recorded {value}"
+
+        self.connector.tool_registry.register_tool(
+            "record", "Records a value", record,
+            [{"name": "value", "type": "int", "description": "Value to record"}]
+        )
+
+    def stream_reply(self, chunks, **kwargs):
+        self.stream = _FakeStream(chunks)
+        self.connector.client = _FakeClient(self.stream)
+        return asyncio.run(self.connector._stream_reply(**kwargs))
+
+    def test_text_reply(self):
+        partials = []
+        reply, tool_calls, tool_results = self.stream_reply(
+            [_chunk("Hello"), _chunk(", world")], callback=partials.append, prefix="> "
+        )
+        self.assertEqual(reply, "Hello, world")
+        self.assertEqual(partials, ["> Hello", "> Hello, world"])
+        self.assertEqual(tool_calls, [])
+        self.assertEqual(tool_results, [])
+
+    def test_tool_calls_assembled_from_fragments(self):
+        chunks = [
+            _chunk(tool_calls=[_call_delta(0, "call_a", "rec", '{"val')]),
+            _chunk(tool_calls=[_call_delta(0, name="ord", arguments='ue": "1"}')]),
+            _chunk(tool_calls=[_call_delta(1, "call_b", "record", '{"value": 2}')]),
+            _chunk("Done"),
+        ]
+        reply, tool_calls, tool_results = self.stream_reply(chunks, execute_tools=True)
+
+        self.assertEqual(reply, "Done")
+        self.assertEqual(tool_calls, [
+            {"id": "call_a", "type": "function",
+             "function": {"name": "record", "arguments": '{"value": "1"}'}},
+            {"id": "call_b", "type": "function",
+             "function": {"name": "record", "arguments": '{"value": 2}'}},
+        ])
+        self.assertEqual(tool_results, [
+            "Tool 'record' executed: recorded 1",
+            "Tool 'record' executed: recorded 2",
+        ])
+
+        # Arguments are converted to the parameter type, the first call runs
+        # as soon as the second starts and the last one when the stream ends
+        self.assertEqual(self.executed, [(1, 3), (2, 4)])
+
+    def test_tools_not_offered_without_execute_tools(self):
+        self.stream_reply([_chunk("Hi")])
+        self.assertEqual(self.connector.client.requests[0]["tool_choice"], "none")
+
+    def test_tool_calls_ignored_without_execute_tools(self):
+        # A backend that calls tools despite tool_choice "none"
+        reply, tool_calls, tool_results = self.stream_reply(
+            [_chunk(tool_calls=[_call_delta(0, "call_a", "record", '{"value": 1}')]), _chunk("Hi")]
+        )
+        self.assertEqual(reply, "Hi")
+        self.assertEqual(tool_calls, [])
+        self.assertEqual(tool_results, [])
+        self.assertEqual(self.executed, [])
+
+    def test_tools_registered_later_are_offered(self):
+        def offered():
+            return [tool["function"]["name"] for tool in self.connector.client.requests[-1]["tools"]]
+
+        self.stream_reply([_chunk("Hi")], execute_tools=True)
+        self.assertIn("record", offered())
+        self.assertNotIn("later", offered())
+
+        self.connector.tool_registry.register_tool("later", "Registered later", lambda: "done")
+        self.stream_reply([_chunk("Hi")], execute_tools=True)
+        self.assertIn("later", offered())
+
+        # The system prompt cannot go stale as it does not list any tools
+        self.assertNotIn("create_box", self.connector._messages[0]["content"])
+
+    def test_unknown_tool(self):
+        _, _, tool_results = self.stream_reply(
+            [_chunk(tool_calls=[_call_delta(0, "call_a", "missing", "{}")])], execute_tools=True
+        )
+        self.assertEqual(tool_results, ["Error: Tool 'missing' not found"])
+        self.assertEqual(self.executed, [])
+
+
+class TestDeferredRecompute(unittest.TestCase):
+    def setUp(self):
+        self.connector = LLMConnector()
+        self.document = mock.Mock()
+        patch = mock.patch.object(FreeCAD, "ActiveDocument", self.document, create=True)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+        def change(value, recompute=True):
+            if recompute:
+                self.document.recompute()
+            return "changed"
+
+        self.connector.tool_registry.register_tool(
+            "change", "Changes the document", change,
+            [{"name": "value", "type": "int", "description": "New value"}], recompute=True
+        )
+
+    def send(self, stream):
+        self.connector.client = _FakeClient(stream)
+        with mock.patch.object(self.connector, "_prepare_client", return_value=None):
+            return asyncio.run(self.connector.send_message_async("Change it"))
+
+    def test_single_recompute_for_several_tools(self):
+        calls = [_chunk(tool_calls=[_call_delta(i, f"call_{i}", "change", '{"value": 1}')])
+                 for i in range(3)]
+        self.send(_FakeStream(calls))
+        self.document.recompute.assert_called_once_with()
+
+    def test_recompute_when_stream_fails(self):
+        calls = [_chunk(tool_calls=[_call_delta(0, "call_0", "change", '{"value": 1}')]),
+                 _chunk(tool_calls=[_call_delta(1, "call_1", "change", '{"value": 2}')])]
+        reply = self.send(_FakeStream(calls, ConnectionError("Connection lost")))
+
+        self.assertEqual(reply, "Error: Connection lost")
+        self.document.recompute.assert_called_once_with()
+
+    def test_no_recompute_without_tools(self):
+        self.send(_FakeStream([_chunk("Hello")]))
+        self.document.recompute.assert_not_called()
+
+
+class TestConcurrentRequests(unittest.TestCase):
+    def test_requests_do_not_interleave(self):
+        connector = LLMConnector()
+
+        async def create(messages, **kwargs):
+            # Answer the last user message, yielding to other requests while streaming
+            question = next(m["content"] for m in reversed(messages) if m["role"] == "user")
+            chunks = [_chunk("Re: "), _chunk(question)]
+
+            async def stream():
+                for chunk in chunks:
+                    await asyncio.sleep(0)
+                    yield chunk
+
+            return stream()
+
+        connector.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+        async def send_both():
+            return await asyncio.gather(connector.send_message_async("one"),
+                                        connector.send_message_async("two"))
+
+        with mock.patch.object(connector, "_prepare_client", return_value=None):
+            replies = asyncio.run(send_both())
+
+        self.assertEqual(replies, ["Re: one", "Re: two"])
+        self.assertEqual([m["content"] for m in connector.conversation_history],
+                         ["one", "Re: one", "two", "Re: two"])
+
+
+class TestHistoryWindow(unittest.TestCase):
+    def setUp(self):
+        # Without a client the evicted messages are only buffered, not summarized
+        self.connector = LLMConnector(max_history=4)
+
+    def assertPayloadMatchesHistory(self):
+        self.assertEqual(self.connector._messages[1:], list(self.connector.conversation_history))
+
+    def test_messages_added_within_window(self):
+        self.connector.add_message("user", "a")
+        self.connector.add_message("assistant", "b")
+
+        self.assertEqual([m["content"] for m in self.connector.conversation_history], ["a", "b"])
+        self.assertEqual(self.connector._summary_buffer, [])
+        self.assertPayloadMatchesHistory()
+
+    def test_oldest_message_evicted(self):
+        for content in "abcde":
+            self.connector.add_message("user", content)
+
+        self.assertEqual([m["content"] for m in self.connector.conversation_history], list("bcde"))
+        self.assertEqual([m["content"] for m in self.connector._summary_buffer], ["a"])
+        self.assertPayloadMatchesHistory()
+
+    def test_tool_results_evicted_with_their_call(self):
+        calls = [{"id": "1"}, {"id": "2"}]
+        self.connector.add_message("user", "a")
+        self.connector.add_message("assistant", None, tool_calls=calls)
+        self.connector.add_message("tool", "r1", tool_call_id="1")
+        self.connector.add_message("tool", "r2", tool_call_id="2")
+
+        # Evicts the user message
+        self.connector.add_message("assistant", "b")
+        self.assertEqual(self.connector.conversation_history[0]["tool_calls"], calls)
+
+        # Evicts the tool call, its results must not stay behind
+        self.connector.add_message("user", "c")
+
+        history = list(self.connector.conversation_history)
+        self.assertEqual([m["content"] for m in history], ["b", "c"])
+        self.assertEqual([m["role"] for m in self.connector._summary_buffer],
+                         ["user", "assistant", "tool", "tool"])
+        self.assertPayloadMatchesHistory()
+
+
+class TestSummary(unittest.TestCase):
+    def setUp(self):
+        self.connector = LLMConnector()
+        self.evicted = [{"role": "user", "content": "a"}, {"role": "assistant", "content": "b"}]
+
+    def summarize(self, create):
+        self.connector.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        self.connector._summary_buffer = [{"role": "user", "content": "c"}]
+        asyncio.run(self.connector._summarize(self.evicted))
+
+    def test_summary(self):
+        async def create(**kwargs):
+            message = SimpleNamespace(content="Summary")
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+        self.summarize(create)
+        self.assertEqual(self.connector._summary, "Summary")
+        self.assertEqual([m["content"] for m in self.connector._summary_buffer], ["c"])
+
+    def test_messages_kept_when_summary_fails(self):
+        async def create(**kwargs):
+            raise ConnectionError("Connection lost")
+
+        self.summarize(create)
+        self.assertIsNone(self.connector._summary)
+        self.assertEqual([m["content"] for m in self.connector._summary_buffer], ["a", "b", "c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
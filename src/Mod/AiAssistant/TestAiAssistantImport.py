@@ -0,0 +1,115 @@
+"""
+Unit tests for the AI Assistant file importer
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import FreeCAD
+import AiAssistantImport
+
+
+class TestAiAssistantImport(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.loaded = []
+        AiAssistantImport.clear_cache()
+
+        # Record which loader runs instead of loading into the GUI
+        handlers = {
+            key: (lambda filename, data, key=key: self.loaded.append(key) or True)
+            for key in AiAssistantImport.HANDLERS
+        }
+        patches = [
+            mock.patch.dict(AiAssistantImport.HANDLERS, handlers),
+            mock.patch.object(FreeCAD, "GuiUp", False, create=True),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        AiAssistantImport.clear_cache()
+        shutil.rmtree(self.directory)
+
+    def write(self, data, name="file.json"):
+        filename = os.path.join(self.directory, name)
+        with open(filename, "w") as f:
+            f.write(data if isinstance(data, str) else json.dumps(data))
+        return filename
+
+    def test_conversation(self):
+        filename = self.write({"conversation": [{"role": "user", "content": "Hi"}]})
+        self.assertTrue(AiAssistantImport.openDocument(filename))
+        self.assertEqual(self.loaded, ["conversation"])
+
+    def test_settings(self):
+        filename = self.write({"settings": {}})
+        self.assertTrue(AiAssistantImport.openDocument(filename))
+        self.assertEqual(self.loaded, ["settings"])
+
+    def test_section_precedence(self):
+        # The conversation is loaded whichever order the sections are in
+        for data in ('{"settings": {}, "conversation": []}',
+                     '{"conversation": [], "settings": {}}'):
+            self.loaded.clear()
+            self.assertTrue(AiAssistantImport.openDocument(self.write(data)))
+            self.assertEqual(self.loaded, ["conversation"])
+
+    @unittest.skipIf(AiAssistantImport.ijson is None, "ijson is not installed")
+    def test_scan_stops_at_conversation(self):
+        # Everything after the conversation key is left unparsed
+        filename = self.write('{"settings": {}, "conversation": [], "broken": ')
+        self.assertEqual(AiAssistantImport._scan_section(filename), "conversation")
+
+    def test_unknown_section(self):
+        filename = self.write({"something": 1})
+        self.assertFalse(AiAssistantImport.openDocument(filename))
+        self.assertEqual(self.loaded, [])
+
+    def test_malformed_file(self):
+        filename = self.write('{"settings": ')
+        self.assertFalse(AiAssistantImport.openDocument(filename))
+        self.assertEqual(self.loaded, [])
+
+    def test_open_alias(self):
+        self.assertIs(AiAssistantImport.open, AiAssistantImport.openDocument)
+
+    def test_decode_cached(self):
+        filename = self.write({"settings": {"a": 1}})
+        self.assertIs(AiAssistantImport._load_json(filename), AiAssistantImport._load_json(filename))
+
+    def test_decode_invalidated_by_mtime(self):
+        filename = self.write({"settings": {"a": 1}})
+        first = AiAssistantImport._load_json(filename)
+
+        # Same size, different contents and modification time
+        self.write({"settings": {"a": 2}})
+        st = os.stat(filename)
+        os.utime(filename, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+        self.assertEqual(AiAssistantImport._load_json(filename), {"settings": {"a": 2}})
+        self.assertIsNot(AiAssistantImport._load_json(filename), first)
+
+    def test_decode_invalidated_by_size(self):
+        filename = self.write({"settings": {"a": 1}})
+        st = os.stat(filename)
+        AiAssistantImport._load_json(filename)
+
+        # Different size, same modification time
+        self.write({"settings": {"a": 10}})
+        os.utime(filename, ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertEqual(AiAssistantImport._load_json(filename), {"settings": {"a": 10}})
+
+    def test_clear_cache(self):
+        filename = self.write({"settings": {}})
+        first = AiAssistantImport._load_json(filename)
+        AiAssistantImport.clear_cache()
+        self.assertIsNot(AiAssistantImport._load_json(filename), first)
+
+
+if __name__ == "__main__":
+    unittest.main()